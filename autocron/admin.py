@@ -78,30 +78,22 @@ class Admin:
 
     def set_max_workers(self, workers):
         """Set the number of workers."""
-        settings = self.interface.get_settings()
-        settings.max_workers = workers
-        self.interface.update_settings(settings)
+        self.interface.change_settings(max_workers=workers)
         print(f"set max_workers to {workers}")
 
     def set_autocron_lock(self, flag):
         """Set the autocron_lock flag."""
-        settings = self.interface.get_settings()
-        settings.autocron_lock = convert_flag(flag)
-        self.interface.update_settings(settings)
+        self.interface.change_settings(autocron_lock=convert_flag(flag))
         print(f"set autocron lock to {flag}")
 
     def set_monitor_lock(self, flag):
         """Set the monitor_lock flag."""
-        settings = self.interface.get_settings()
-        settings.monitor_lock = convert_flag(flag)
-        self.interface.update_settings(settings)
+        self.interface.change_settings(monitor_lock=convert_flag(flag))
         print(f"set monitor lock to {flag}")
 
     def set_blocking_mode(self, flag):
         """Set the blocking_mode flag."""
-        settings = self.interface.get_settings()
-        settings.blocking_mode = convert_flag(flag)
-        self.interface.update_settings(settings)
+        self.interface.change_settings(blocking_mode=convert_flag(flag))
         print(f"set blocking mode to {flag}")
 
     def set_worker_idle_time(self, idle_time):
@@ -109,9 +101,7 @@ class Admin:
         Set the idle time of the worker in seconds. This is the time the
         worker sleeps when no new tasks are on due.
         """
-        settings = self.interface.get_settings()
-        settings.worker_idle_time = idle_time
-        self.interface.update_settings(settings)
+        self.interface.change_settings(worker_idle_time=idle_time)
         print(f"set worker idle time to {idle_time} seconds")
 
     def set_monitor_idle_time(self, idle_time):
@@ -119,9 +109,7 @@ class Admin:
         Set the idle time of the worker in seconds. This is the time the
         worker sleeps when no new tasks are on due.
         """
-        settings = self.interface.get_settings()
-        settings.monitor_idle_time = idle_time
-        self.interface.update_settings(settings)
+        self.interface.change_settings(monitor_idle_time=idle_time)
         print(f"set monitor idle time to {idle_time} seconds")
 
     def set_result_ttl(self, ttl):
@@ -129,16 +117,12 @@ class Admin:
         Set the result time to life in seconds. ttl is an integer. This is
         the timespan a result will get stored in the database.
         """
-        settings = self.interface.get_settings()
-        settings.result_ttl = ttl
-        self.interface.update_settings(settings)
+        self.interface.change_settings(result_ttl=ttl)
         print(f"Set result-ttl to {ttl} seconds")
 
     def set_defaults(self):
         """Reset all settings to the default values."""
-        settings = self.interface.get_settings()
-        settings.__dict__.update(SETTINGS_DEFAULT_DATA)
-        self.interface.update_settings(settings)
+        self.interface.change_settings(**SETTINGS_DEFAULT_DATA)
         print("\nautocron reset to default data:")
         self.show_info()
 
@@ -149,7 +133,7 @@ class Admin:
         """
         answer = input("sure to delete the current database? [y/n]: ")
         if answer.lower() == "y":
-            self.interface.db_name.unlink(missing_ok=True)
+            self.interface.delete_database()
             self.interface.db_name = None
         else:
             print("abort command")
@@ -117,9 +117,7 @@ class Engine:
                 # override the already loaded value
                 self.interface.max_workers = workers
                 # and update the settings
-                settings = self.interface.get_settings()
-                settings.max_workers = workers
-                self.interface.update_settings(settings)
+                self.interface.change_settings(max_workers=workers)
 
             # start the monitor process:
             monitor_file = pathlib.Path(__file__).parent / MONITOR_MODULE_NAME
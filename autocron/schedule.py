@@ -30,25 +30,42 @@ range like "a,b,m-n,c,p-q" is allowed.
 #
 # license: MIT
 
+import bisect
 import calendar
+import collections
 import datetime
+import functools
+import itertools
 import re
-import types
 
 
+EVERY_MINUTE_CRONTAB = "* * * * *"
 CRONTAB_PARTS = ["minutes", "hours", "days", "months", "days_of_week"]
+CRONTAB_MASKS = [f"{name}_mask" for name in CRONTAB_PARTS]
 CRONTAB_MAX_VALUES = [59, 23, 31, 12, 6]
 CRONTAB_MIN_VALUES = [0, 0, 1, 1, 0]
-CRONTAB_SUBSTITUTE = re.compile(r"\[|\]|\s|_")
 
 RE_REPEAT = re.compile(r"\*/(\d+)")
-RE_SEQUENCE = re.compile(r"(\d+)-(\d+)")
+
+CronParts = collections.namedtuple("CronParts", CRONTAB_PARTS + CRONTAB_MASKS)
 
 DAYS_PER_WEEK = 7
+ALL_WEEKDAYS_MASK = (1 << DAYS_PER_WEEK) - 1
+MONTHS_PER_YEAR = 12
+# days per month for non-leap years, index 0 is a placeholder:
+DAYS_PER_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+FEBRUARY = 2
+DAYS_PER_YEAR = 365  # without leap day
+DAYS_BEFORE_MONTH = tuple(
+    sum(DAYS_PER_MONTH[:month]) for month in range(len(DAYS_PER_MONTH))
+)
+SCHEDULE_CACHE_SIZE = 4096
+ONE_MINUTE = datetime.timedelta(minutes=1)
 MAX_SCHEDULE_ITERATIONS = 10_000
 MAX_SCHEDULE_ITERATIONS_ERROR_MSG = """\
 max schedule iteration ({}) exceeded. Date to far in the future.
 Current date: {}"""
+NO_SCHEDULE_ERROR_MSG = "crontab '{}' never matches a valid date."
 
 
 def get_next_value(value, values):
@@ -57,64 +74,162 @@ def get_next_value(value, values):
     None if there is no larger value. Assumes the values are in sorted
     order.
     """
-    for item in values:
-        if item > value:
-            return item
+    index = bisect.bisect_right(values, value)
+    if index < len(values):
+        return values[index]
+    return None
+
+
+def get_mask(values):
+    """
+    Returns an integer used as bitmask where the bits at the positions
+    given by the values are set. All values are cron-values in the range
+    0-59, so the mask fits into a 64 bit word.
+    """
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+
+def get_values_from_mask(mask):
+    """
+    Returns a sorted tuple of the values with a bit set in the mask.
+    This is the inverse function of get_mask().
+    """
+    values = []
+    while mask:
+        lowest_bit = mask & -mask
+        values.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return tuple(values)
+
+
+def get_next_value_from_mask(value, mask):
+    """
+    Returns the next value larger than value with a bit set in the mask
+    or None if there is no larger value. This is the bitmask-equivalent
+    to get_next_value().
+    """
+    # clear all bits up to and including the bit for value:
+    mask = mask >> (value + 1) << (value + 1)
+    if mask:
+        # isolate the lowest bit remaining:
+        return (mask & -mask).bit_length() - 1
     return None
 
 
+def value_in_mask(value, mask):
+    """
+    Returns True if the bit for value is set in the mask.
+    """
+    return bool(mask >> value & 1)
+
+
+@functools.lru_cache(maxsize=512)
+def get_next_value_table(mask, max_value):
+    """
+    Returns a lookup table as tuple with the results of
+    get_next_value_from_mask() for all values in the range
+    0..max_value. So the next allowed value is just the table entry
+    indexed by the current value.
+    """
+    return tuple(
+        get_next_value_from_mask(value, mask) for value in range(max_value + 1)
+    )
+
+
+@functools.lru_cache(maxsize=512)
 def get_numeric_sequence(pattern, min_value, max_value):
     """
-    Converts a pattern to a numeric sequence:
-    * -> [0..max_value] stepwidth 1
-    */n -> [0..max_value] stepwidth n
-    m-n -> [m..n] stepwidth 1
-    m,n -> [m,n]
-    a-b,m,p-q -> [a..b,m,p..q] partial stepwidth 1
+    Converts a pattern to a sorted numeric sequence returned as a tuple:
+    * -> (0..max_value) stepwidth 1
+    */n -> (0..max_value) stepwidth n
+    m-n -> (m..n) stepwidth 1
+    m,n -> (m,n)
+    a-b,m,p-q -> (a..b,m,p..q) partial stepwidth 1
+
+    The results are cached and therefore immutable.
     """
     # handle the * case
     if pattern == "*":
-        return list(range(min_value, max_value + 1))
+        return tuple(range(min_value, max_value + 1))
 
     # handle the */n case
     if mo := RE_REPEAT.match(pattern):
         stepwidth = int(mo.group(1))
-        return list(range(min_value, max_value + 1, stepwidth))
+        return tuple(range(min_value, max_value + 1, stepwidth))
 
-    # handle everything else
-    values = []
+    # handle everything else: a comma separated list of single values
+    # and ranges. Collecting the values as bits of a mask keeps them
+    # sorted and unique.
+    mask = 0
     for element in pattern.split(","):
-        if mo := RE_SEQUENCE.match(element):
-            values.extend(list(range(int(mo.group(1)), int(mo.group(2)) + 1)))
+        start, separator, stop = element.partition("-")
+        if separator:
+            start, stop = int(start), int(stop)
+            if start <= stop:
+                # set all bits from start to stop:
+                mask |= (1 << (stop + 1)) - (1 << start)
         else:
-            values.append(int(element))
-    return sorted(set(values))
+            mask |= 1 << int(start)
+    return get_values_from_mask(mask)
+
+
+def get_crontab_field(value):
+    """
+    Converts a keyword-argument of the CronScheduler to a crontab field:
+    lists and tuples of integers get comma separated, other values are
+    used as strings without whitespace. A missing value returns "*".
+    """
+    if not value:
+        return "*"
+    if isinstance(value, (list, tuple)):
+        return ",".join(map(str, value))
+    return "".join(str(value).split())
 
 
+@functools.lru_cache(maxsize=256)
 def get_cron_parts(crontab):
     """
-    Returns a SimpleNamespace object with attribute-names given in
+    Returns a CronParts namedtuple with attribute-names given in
     CRONTAB_PARTS and values provided by get_numeric_sequence() for the
-    given crontab parts. Example:
+    given crontab parts. Additional attributes with the names given in
+    CRONTAB_MASKS hold the according values as bitmasks. Example:
 
     >>> cp = get_cron_parts("* 5 2-4 11 *")
     >>> cp.hours
-    [5]
+    (5,)
     >>> cp.days
-    [2, 3, 4]
+    (2, 3, 4)
 
-    The other attributes are also lists with the according values.
+    >>> cp.days_mask
+    28
+
+    The other attributes are also tuples with the according values.
+    The results are cached and therefore immutable.
     """
-    data = {
-        name: get_numeric_sequence(item, min_value, max_value)
-        for name, item, min_value, max_value in zip(
-            CRONTAB_PARTS,
-            crontab.split(),
-            CRONTAB_MIN_VALUES,
-            CRONTAB_MAX_VALUES,
+    sequences = [
+        get_numeric_sequence(item, min_value, max_value)
+        for item, min_value, max_value in zip(
+            crontab.split(), CRONTAB_MIN_VALUES, CRONTAB_MAX_VALUES
         )
-    }
-    return types.SimpleNamespace(**data)
+    ]
+    masks = [get_mask(sequence) for sequence in sequences]
+    # weekday 7 is also Sunday:
+    days_of_week_mask = masks[-1]
+    masks[-1] = (
+        days_of_week_mask | days_of_week_mask >> DAYS_PER_WEEK
+    ) & ALL_WEEKDAYS_MASK
+    return CronParts(*sequences, *masks)
+
+
+def is_leap_year(year):
+    """
+    Returns True if the given year is a leap year. Same as
+    calendar.isleap() but with a bit-test for the divisibility by four.
+    """
+    return not year & 3 and (year % 100 != 0 or year % 400 == 0)
 
 
 def get_days_per_month(year=None, month=None, schedule=None):
@@ -127,8 +242,50 @@ def get_days_per_month(year=None, month=None, schedule=None):
     if schedule:
         year = schedule.year
         month = schedule.month
-    _, days_per_month = calendar.monthrange(year, month)
-    return days_per_month
+    if month == FEBRUARY and is_leap_year(year):
+        return 29
+    return DAYS_PER_MONTH[month]
+
+
+def get_days_before_month(year, month):
+    """
+    Returns the number of days of the given year before the first day
+    of the given month.
+    """
+    days = DAYS_BEFORE_MONTH[month]
+    if month > FEBRUARY and is_leap_year(year):
+        days += 1
+    return days
+
+
+@functools.lru_cache(maxsize=32)
+def get_months_mask_for_day(day):
+    """
+    Returns a bitmask of the months having at least the given number of
+    days. February counts with 29 days.
+    """
+    return get_mask(
+        month
+        for month in range(1, MONTHS_PER_YEAR + 1)
+        if DAYS_PER_MONTH[month] + (month == FEBRUARY) >= day
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def get_weekday_days_mask(first_weekday, days_of_week_mask):
+    """
+    Returns a bitmask with the days of a month (1-31) set, which are
+    falling on one of the weekdays given by the days_of_week_mask.
+    first_weekday is the weekday of the first day of the month as
+    returned by get_weekday(). Days beyond the end of the month are
+    not cleared.
+    """
+    mask = 0
+    for day in range(1, 32):
+        weekday = (first_weekday + day - 1) % DAYS_PER_WEEK
+        if value_in_mask(weekday, days_of_week_mask):
+            mask |= 1 << day
+    return mask
 
 
 def get_weekday(year=None, month=None, day=None, schedule=None):
@@ -147,6 +304,28 @@ def get_weekday(year=None, month=None, day=None, schedule=None):
     return 0 if weekday > 6 else weekday
 
 
+@functools.lru_cache(maxsize=512)
+def get_first_weekday(year, month):
+    """
+    Returns the weekday of the first day of the given month as
+    get_weekday() does. The scheduler asks for this whenever it moves
+    to another month, so the results are cached.
+    """
+    return get_weekday(year, month, 1)
+
+
+@functools.lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def get_cached_schedule(scheduler, previous_schedule):
+    """
+    Returns the next schedule from the given scheduler for the
+    previous_schedule. Results are cached: schedulers with the same
+    crontab and strict_mode compare equal and share the cached
+    schedules. previous_schedule should be rounded to full minutes to
+    get cache hits for all calls within the same minute.
+    """
+    return scheduler.find_next_schedule(previous_schedule)
+
+
 class CronScheduler:
     """
     Schedules a cron task.
@@ -157,6 +336,19 @@ class CronScheduler:
     next_schedule = cs.get_next_schedule()
     """
 
+    __slots__ = (
+        "_every_minute",
+        "_next_days",
+        "_next_hours",
+        "_next_minutes",
+        "_next_months",
+        "_next_valid_months",
+        "all_weekdays_allowed",
+        "cron_parts",
+        "crontab",
+        "strict_mode",
+    )
+
     # pylint: disable=too-many-arguments
     def __init__(
         self,
@@ -168,24 +360,65 @@ class CronScheduler:
         days_of_week=None,
         strict_mode=False,
     ):
-        if not crontab:
-            items = [
-                str(item) if item else "*"
-                for item in (minutes, hours, days, months, days_of_week)
-            ]
-            crontab = CRONTAB_SUBSTITUTE.sub(
-                lambda mo: " " if mo.group() == "_" else "", "_".join(items)
+        if crontab:
+            # normalize once: single blanks between the fields
+            crontab = " ".join(crontab.split())
+        else:
+            crontab = (
+                f"{get_crontab_field(minutes)} {get_crontab_field(hours)} "
+                f"{get_crontab_field(days)} {get_crontab_field(months)} "
+                f"{get_crontab_field(days_of_week)}"
             )
-        self.cron_parts = get_cron_parts(crontab)
+        self.crontab = crontab
+        self.cron_parts = get_cron_parts(self.crontab)
+        if not all(self.cron_parts[: len(CRONTAB_PARTS)]):
+            # a field with an empty range like "5-3" never matches:
+            raise ValueError(NO_SCHEDULE_ERROR_MSG.format(self.crontab))
         self.strict_mode = strict_mode
+        self._every_minute = self.cron_parts == get_cron_parts(
+            EVERY_MINUTE_CRONTAB
+        )
+        # true if in the crontab all days of a week are allowed, i.e.
+        # the asterisk "*" is set or a list like "1-7" (7 is Sunday):
+        self.all_weekdays_allowed = (
+            self.cron_parts.days_of_week_mask == ALL_WEEKDAYS_MASK
+        )
 
-    @property
-    def all_weekdays_allowed(self):
-        """
-        Returns true if in the crontab all days of a week are allowed,
-        i.e. the asterisk "*" is set.
-        """
-        return len(self.cron_parts.days_of_week) >= DAYS_PER_WEEK
+        # lookup tables for the next allowed values, indexed by the
+        # current value (weekdays are handled by bitmasks):
+        (
+            self._next_minutes,
+            self._next_hours,
+            self._next_days,
+            self._next_months,
+        ) = (
+            get_next_value_table(getattr(self.cron_parts, name), max_value)
+            for name, max_value in zip(
+                CRONTAB_MASKS[:-1], CRONTAB_MAX_VALUES[:-1]
+            )
+        )
+
+        # lookup table for the month-advance in find_next_schedule():
+        # if all weekdays are allowed, the first day of a month is
+        # always the first allowed day. Months with less days than this
+        # are never valid and get skipped.
+        months_mask = self.cron_parts.months_mask
+        if self.all_weekdays_allowed:
+            months_mask &= get_months_mask_for_day(self.cron_parts.days[0])
+        self._next_valid_months = get_next_value_table(
+            months_mask, MONTHS_PER_YEAR
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, CronScheduler):
+            return NotImplemented
+        return (self.crontab, self.strict_mode) == (
+            other.crontab,
+            other.strict_mode,
+        )
+
+    def __hash__(self):
+        return hash((self.crontab, self.strict_mode))
 
     def get_next_schedule(self, previous_schedule=None):
         """
@@ -193,10 +426,59 @@ class CronScheduler:
         given previous_schedule (a datetime-object). Returns a
         datetime-object.
         """
-        dt = datetime.datetime
         if previous_schedule is None:
-            previous_schedule = dt.now()
+            previous_schedule = datetime.datetime.now()
+        # the resolution of a schedule is one minute, so seconds and
+        # microseconds don't matter. Removing them allows the cache to
+        # return the same result for all calls within a minute.
+        # (the returned schedules are always naive datetime-objects.)
+        previous_schedule = previous_schedule.replace(
+            second=0, microsecond=0, tzinfo=None
+        )
+        if self._every_minute:
+            # shortcut for the default crontab:
+            return previous_schedule + ONE_MINUTE
+        return get_cached_schedule(self, previous_schedule)
 
+    def iter_schedules(self, start=None):
+        """
+        Generator returning the schedules following the given start (a
+        datetime-object) or the current date in chronological order.
+        The schedules are not cached, so iterating over a larger number
+        of schedules does not displace the cached ones.
+
+        >>> cs = CronScheduler("0 12 * * *")
+        >>> schedules = cs.iter_schedules(datetime.datetime(2024, 2, 8))
+        >>> str(next(schedules))
+        '2024-02-08 12:00:00'
+        >>> str(next(schedules))
+        '2024-02-09 12:00:00'
+        """
+        if start is None:
+            start = datetime.datetime.now()
+        schedule = start.replace(second=0, microsecond=0, tzinfo=None)
+        if self._every_minute:
+            while True:
+                schedule += ONE_MINUTE
+                yield schedule
+        find_next_schedule = self.find_next_schedule
+        while True:
+            schedule = find_next_schedule(schedule)
+            yield schedule
+
+    def get_next_schedules(self, count, start=None):
+        """
+        Returns a list with the next count schedules following the
+        given start (a datetime-object) or the current date.
+        """
+        return list(itertools.islice(self.iter_schedules(start), count))
+
+    def find_next_schedule(self, previous_schedule):
+        """
+        Uncached calculation of the next schedule following the given
+        previous_schedule (a datetime-object). Returns a datetime-object.
+        """
+        dt = datetime.datetime
         year = previous_schedule.year
         month = previous_schedule.month
         day = previous_schedule.day
@@ -217,23 +499,34 @@ class CronScheduler:
         if day is not None:
             return dt(year, month, day, hour, minute)
 
+        # index 0 returns the first valid month of a year:
+        if self._next_valid_months[0] is None:
+            raise ValueError(NO_SCHEDULE_ERROR_MSG.format(self.crontab))
+        # if weekdays are restricted, the weekday of the first day of
+        # the month gets tracked while advancing the months:
+        first_weekday = None
+        if not self.all_weekdays_allowed:
+            first_weekday = get_first_weekday(year, month)
         for counter in range(MAX_SCHEDULE_ITERATIONS):
-            month = self.get_next_month(month)
-            if month:
-                day = self.get_first_day(year, month)
-                if day is not None:
-                    return dt(year, month, day, hour, minute)
-                continue
-            year += 1
-            month = self.cron_parts.months[0]  # get first month
-            day = self.get_first_day(year, month)
+            days_before = get_days_before_month(year, month)
+            next_month = self._next_valid_months[month]
+            if next_month is None:
+                # continue with the first valid month of the next year:
+                days_before -= DAYS_PER_YEAR + is_leap_year(year)
+                year += 1
+                next_month = self._next_valid_months[0]
+            month = next_month
+            if first_weekday is not None:
+                delta = get_days_before_month(year, month) - days_before
+                first_weekday = (first_weekday + delta) % DAYS_PER_WEEK
+            day = self.get_first_day(year, month, first_weekday)
             if day is not None:
                 return dt(year, month, day, hour, minute)
 
         # not returning from inside the loop is a potential
         # endless loop. So after MAX_SCHEDULE_ITERATIONS there
         # is a hard break here:
-        schedule = dt(year, month, day, hour, minute)
+        schedule = dt(year, month, 1, hour, minute)
         msg = MAX_SCHEDULE_ITERATIONS_ERROR_MSG.format(counter, schedule)
         raise ValueError(msg)
 
@@ -242,78 +535,50 @@ class CronScheduler:
         Returns the next minute of configured minutes. Returns None if
         there is no next minute after the given one.
         """
-        return get_next_value(minute, self.cron_parts.minutes)
+        return self._next_minutes[minute]
 
     def get_next_hour(self, hour):
         """
         Returns the next hour of configured hours. Returns None if
         there is no next hour after the given one.
         """
-        return get_next_value(hour, self.cron_parts.hours)
+        return self._next_hours[hour]
 
-    def get_first_day(self, year, month):
+    def get_first_day(self, year, month, first_weekday=None):
         """
         Wrapper for get_next_day with day=0 to get the first allowed day
         of a month or None, if the month has no allwed days.
         """
-        return self.get_next_day(year, month, day=0)
+        return self.get_next_day(year, month, 0, first_weekday)
 
-    def get_next_day(self, year, month, day):
+    def get_next_day(self, year, month, day, first_weekday=None):
         """
         Returns the next allowed day after the given day. Returns the
         day or None in case that there is no follow up day for the month
-        and year.
+        and year. first_weekday is the weekday of the first day of the
+        month; if not given, it gets calculated on demand.
         """
-        # pylint:disable=too-many-return-statements
-        next_day = get_next_value(day, self.cron_parts.days)
-
         if self.all_weekdays_allowed:
             # strict_mode doesn't matter
-            if next_day is not None:
-                if next_day <= get_days_per_month(year, month):
-                    return next_day
-            return None
-
-        if self.strict_mode:
-            if next_day is None:
-                return None
-            # check whether next_day is an allowed day of the
-            # current month.
-            if next_day > get_days_per_month(year, month):
-                return None
-            # the day must match one of the allowed weekdays
-            weekday_of_next_day = get_weekday(year, month, next_day)
-            if weekday_of_next_day in self.cron_parts.days_of_week:
-                return next_day
-            # recursion is save because there are just a few days per month
-            return self.get_next_day(year, month, next_day)
-
-        # no strict mode but days_of_week are defined:
-        # the next day and the next allowed weekday are valid days,
-        # return the one that comes first
-
-        # `day` could be zero to get the first day of the month.
-        # this is necessary for the first get_next_value() call
-        # but will trigger a ValueError in the calendar module.
-        # in this case set day to 1:
-
-        if day == 0:
-            day = 1
-        weekday_of_day = get_weekday(year, month, day)
-        next_weekday = get_next_value(
-            weekday_of_day, self.cron_parts.days_of_week
-        )
-        if next_weekday is None:
-            next_weekday = self.cron_parts.days_of_week[0] + DAYS_PER_WEEK
-        delta = next_weekday - weekday_of_day
-        next_weekday_day = day + delta
-
-        if next_day is None:
-            next_day = next_weekday_day
+            next_day = self._next_days[day]
         else:
-            next_day = min(next_day, next_weekday_day)
-        if next_day <= get_days_per_month(year, month):
-            return next_day
+            # days_of_week are defined: get the days of the month
+            # falling on allowed weekdays and combine them with the
+            # allowed days. In strict_mode both must match, otherwise
+            # one of both.
+            if first_weekday is None:
+                first_weekday = get_first_weekday(year, month)
+            weekdays_mask = get_weekday_days_mask(
+                first_weekday, self.cron_parts.days_of_week_mask
+            )
+            if self.strict_mode:
+                days_mask = self.cron_parts.days_mask & weekdays_mask
+            else:
+                days_mask = self.cron_parts.days_mask | weekdays_mask
+            next_day = get_next_value_from_mask(day, days_mask)
+        if next_day is not None:
+            if next_day <= get_days_per_month(year, month):
+                return next_day
         return None
 
     def get_next_month(self, month):
@@ -321,4 +586,14 @@ class CronScheduler:
         Returns the next month of configured months. Returns None if
         there is no next month after the given one.
         """
-        return get_next_value(month, self.cron_parts.months)
+        return self._next_months[month]
+
+
+@functools.lru_cache(maxsize=256)
+def get_cron_scheduler(crontab, strict_mode=False):
+    """
+    Returns a CronScheduler for the given crontab. Schedulers don't
+    change after initialization, so the same instance gets returned for
+    the same arguments instead of building the lookup tables again.
+    """
+    return CronScheduler(crontab=crontab, strict_mode=strict_mode)
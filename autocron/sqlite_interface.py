@@ -17,6 +17,8 @@ Data models, sql-definition and access routines.
 
 import datetime
 import functools
+import logging
+import os
 import pathlib
 import pickle
 import queue
@@ -27,16 +29,47 @@ import time
 import uuid
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_STORAGE = ".autocron"
 TEMPORARY_PREFIX = ".temp-"
 REGISTER_BACKGROUND_TASK_TIMEOUT = 2.0
+REGISTER_BACKGROUND_TASK_BATCH_SIZE = 64
 
-SQLITE_OPERATIONAL_ERROR_RETRIES = 100
+# sqlite waits up to SQLITE_BUSY_TIMEOUT seconds for a locked database
+# before raising an OperationalError. The retries are just a fallback
+# with a delay growing by SQLITE_DELAY_INCREMENT_FACTOR on every retry:
+SQLITE_BUSY_TIMEOUT = 5.0
+SQLITE_OPERATIONAL_ERROR_RETRIES = 3
 SQLITE_OPERATIONAL_ERROR_DELAY = 0.01
-SQLITE_DELAY_INCREMENT_STEPS = 20
-SQLITE_DELAY_INCREMENT_FACTOR = 1.5
-
-SQLITE_EXCLUSIVE_ACCESS = "BEGIN EXCLUSIVE"
+SQLITE_DELAY_INCREMENT_FACTOR = 2
+
+# takes the write lock at the start of a transaction. Other than
+# BEGIN EXCLUSIVE this does not block readers:
+SQLITE_IMMEDIATE_ACCESS = "BEGIN IMMEDIATE"
+
+# pragmas applied to every new connection. In WAL mode readers don't
+# block the writer and a commit is an append to the log file instead
+# of rewriting the journal. With WAL synchronous=NORMAL is safe against
+# corruption and avoids a fsync on every commit.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -64000",  # in KiB, allocated on demand
+    "PRAGMA mmap_size = 268435456",  # in bytes
+)
+SQLITE_WAL_FILE_SUFFIXES = ("-wal", "-shm")
+# stored as PRAGMA user_version. Version 1 stores the datetimes as
+# integers, databases with a lower version get migrated once:
+SQLITE_SCHEMA_VERSION = 1
+
+# protocol 5 is available for all supported Python versions and
+# is faster and more compact than the default protocol:
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+# precomputed payloads for the most common values:
+PICKLED_NONE = pickle.dumps(None, protocol=PICKLE_PROTOCOL)
+PICKLED_EMPTY_ARGUMENTS = pickle.dumps(((), {}), protocol=PICKLE_PROTOCOL)
 
 SETTINGS_DEFAULT_WORKERS = 1
 SETTINGS_DEFAULT_RUNNING_WORKERS = 0
@@ -79,51 +112,101 @@ STATUS_MESSAGES = {
 
 STATUS_MESSAGE_MAX_LEN = len(max(STATUS_MESSAGES.values(), key=len))
 
+# datetimes are stored as integer microseconds since this naive epoch:
+DATETIME_EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
 
-# sqlite3 default adapters and converters deprecated as of Python 3.12:
+# The datetime conversion is done by the models and not by registering
+# an adapter and a converter to sqlite3: registered adapters are global
+# and would change the storage of datetimes for all other sqlite3 users
+# in the same process.
 def datetime_adapter(value):
     """
-    Gets a python datetime-instance and returns an ISO 8601 formated
-    string for sqlite3 storage.
+    Gets a python datetime-instance and returns the microseconds since
+    the DATETIME_EPOCH as integer for sqlite3 storage. Integers are
+    compared faster than strings and need no parsing. Timezone aware
+    datetimes are converted to the local time like the naive ones.
     """
-    return value.isoformat()
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - DATETIME_EPOCH) // ONE_MICROSECOND
 
 
 def datetime_converter(value):
     """
-    Gets an ISO 8601 formated byte-string (from sqlite3) and returns a
-    python datetime datatype.
+    Gets the microseconds since the DATETIME_EPOCH as integer (from
+    sqlite3) and returns a python datetime datatype. ISO 8601 formated
+    strings stored by former versions are converted as well.
+    """
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return DATETIME_EPOCH + datetime.timedelta(microseconds=value)
+
+
+def dumps(value):
+    """Returns the value pickled with the PICKLE_PROTOCOL."""
+    if value is None:
+        return PICKLED_NONE
+    return pickle.dumps(value, protocol=PICKLE_PROTOCOL)
+
+
+def dumps_arguments(args, kwargs):
+    """Returns the tuple of the function arguments pickled."""
+    if args == () and kwargs == {}:
+        return PICKLED_EMPTY_ARGUMENTS
+    return dumps((args, kwargs))
+
+
+def connect(db_name):
+    """
+    Returns a new sqlite3 connection to the database db_name with the
+    SQLITE_BUSY_TIMEOUT and the SQLITE_PRAGMAS applied.
     """
-    return datetime.datetime.fromisoformat(value.decode())
+    # connections are used by a single thread, but may get closed from
+    # another one on deleting the database:
+    connection = sqlite3.connect(
+        database=db_name, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False
+    )
+    for pragma in SQLITE_PRAGMAS:
+        connection.execute(pragma)
+    return connection
 
 
-sqlite3.register_adapter(datetime.datetime, datetime_adapter)
-sqlite3.register_converter("datetime", datetime_converter)
+def is_open(connection):
+    """
+    Returns True if the given sqlite3 connection is not closed.
+    """
+    try:
+        connection.in_transaction  # noqa: B018 (raises if closed)
+    except sqlite3.ProgrammingError:
+        return False
+    return True
 
 
 # sqlite3: decorator for SQLiteInterface-methods accessing the database
 def db_access(function):
     """
-    Access decorator. Repeats the decorated function several times in
-    case the database is locked because of write- or exclusive-access.
+    Access decorator. Repeats the decorated function a few times in
+    case the database is still locked after the busy-timeout of the
+    connection because of a write lock.
     """
 
     @functools.wraps(function)
     def wrapper(*args, **kwargs):
         """
         Repeat the wrapped function call in case of an OperationalError.
-        If this fails for SQLITE_MAX_RETRY_LIMIT times, the original
-        error is raised.
+        If this fails for SQLITE_OPERATIONAL_ERROR_RETRIES times, the
+        original error is raised.
         """
         message = ""
         delay = SQLITE_OPERATIONAL_ERROR_DELAY
-        for retry_num in range(SQLITE_OPERATIONAL_ERROR_RETRIES):
+        for _ in range(SQLITE_OPERATIONAL_ERROR_RETRIES):
             try:
                 return function(*args, **kwargs)
             except sqlite3.OperationalError as err:
                 message = str(err)
                 time.sleep(delay)
-            if not retry_num % SQLITE_DELAY_INCREMENT_STEPS:
                 delay *= SQLITE_DELAY_INCREMENT_FACTOR
         raise sqlite3.OperationalError(message)
 
@@ -139,11 +222,31 @@ class Model:
     # class attributes to redefine in subclasses:
     table_name = ""
     columns = {}
+    indexes = ()  # pairs of index name and indexed columns
+    # set from the columns for every subclass:
+    datetime_columns = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.datetime_columns = tuple(
+            name for name, type_ in cls.columns.items() if type_ == "datetime"
+        )
 
     def __init__(self, connection=None):
         self.connection = connection
         self.rowid = None
 
+    def get_storage_data(self):
+        """
+        Returns the attributes as dictionary for the sql parameters
+        with the datetimes converted for storage.
+        """
+        data = self.__dict__.copy()
+        for name in self.datetime_columns:
+            if data[name] is not None:
+                data[name] = datetime_adapter(data[name])
+        return data
+
     def store(self):
         """
         Store a new row. data is a dictionary with all column data.
@@ -152,7 +255,7 @@ class Model:
         columns = ",".join(f":{name}" for name in self.columns)
         sql = f"""INSERT INTO {self.table_name} VALUES ({columns})
                   RETURNING rowid"""
-        cursor = self.connection.run(sql, self.__dict__)
+        cursor = self.connection.run(sql, self.get_storage_data())
         result = cursor.fetchone()
         # result is a tuple representing the RETURNING values
         # from the sql command. In this case it is a tuple with
@@ -160,12 +263,24 @@ class Model:
         self.rowid = result[0]
         return self.rowid
 
+    @classmethod
+    def store_many(cls, connection, instances):
+        """
+        Store the given instances as new rows with a single
+        executemany() command. The `rowid` attributes of the instances
+        are not set.
+        """
+        columns = ",".join(f":{name}" for name in cls.columns)
+        sql = f"INSERT INTO {cls.table_name} VALUES ({columns})"
+        data = [instance.get_storage_data() for instance in instances]
+        connection.run(sql, data, many=True)
+
     def update(self):
         """Make the current set of attributes persistent."""
         columns = ",".join(f"{name} = :{name}" for name in self.columns)
         sql = f"""UPDATE {self.table_name} SET {columns}
                   WHERE rowid == :rowid"""
-        self.connection.run(sql, self.__dict__)
+        self.connection.run(sql, self.get_storage_data())
 
     def delete(self):
         """Delete this instance by the rowid."""
@@ -195,7 +310,7 @@ class Model:
             sql = f"{sql} WHERE rowid == :rowid"
             data = {"rowid": rowid}
         cursor = connection.run(sql, data)
-        cursor.row_factory = getattr(cls, "row_factory", None)
+        cls._set_row_factory(cursor)
         if data := cursor.fetchone():
             instance = cls(connection)
             instance.__dict__.update(data)
@@ -210,24 +325,81 @@ class Model:
         """
         sql = cls._get_sql_select()
         cursor = connection.run(sql)
-        cursor.row_factory = getattr(cls, "row_factory", None)
-        data_set = cursor.fetchall()
+        cls._set_row_factory(cursor)
+        # iterating the cursor converts the rows one by one without
+        # materializing all rows first:
         instances = []
-        for data in data_set:
+        for data in cursor:
             instance = cls(connection)
             instance.__dict__.update(data)
             instances.append(instance)
         return instances
 
+    @classmethod
+    def _set_row_factory(cls, cursor):
+        """
+        Set a row factory for the cursor converting the rows to
+        dictionaries by `row_to_data()`. The column names are taken
+        from the cursor description once for all rows.
+        """
+        if cursor.description:
+            column_names = tuple(entry[0] for entry in cursor.description)
+            cursor.row_factory = lambda _, row: cls.row_to_data(
+                column_names, row
+            )
+
+    @classmethod
+    def row_to_data(cls, column_names, row):
+        """
+        Converts a row to a dictionary with the stored datetimes
+        converted. Models can extend this to convert other values.
+        """
+        data = dict(zip(column_names, row))
+        for name in cls.datetime_columns:
+            if data.get(name) is not None:
+                data[name] = datetime_converter(data[name])
+        return data
+
     @classmethod
     def create_table(cls, connection):
-        """Create the database table for the model if not already existing."""
+        """
+        Create the database table and the indexes for the model if not
+        already existing.
+        """
         columns = ",".join(
             f"{field} {type}" for field, type in cls.columns.items()
         )
         connection.run(
             f"CREATE TABLE IF NOT EXISTS {cls.table_name}({columns})"
         )
+        for name, index_columns in cls.indexes:
+            connection.run(
+                f"""CREATE INDEX IF NOT EXISTS {name}
+                    ON {cls.table_name}({index_columns})"""
+            )
+
+    @classmethod
+    def migrate_datetime_columns(cls, connection):
+        """
+        Convert datetimes stored as ISO 8601 strings by former versions
+        to the integer format. In sqlite integers are always less than
+        strings, so mixed formats would break the comparisons.
+        """
+        for name in cls.datetime_columns:
+            cursor = connection.run(
+                f"""SELECT {name}, rowid FROM {cls.table_name}
+                    WHERE typeof({name}) == 'text'"""
+            )
+            if rows := cursor.fetchall():
+                connection.run(
+                    f"""UPDATE {cls.table_name} SET {name} = ?
+                        WHERE rowid == ?""",
+                    [
+                        (datetime_adapter(datetime_converter(value)), rowid)
+                        for value, rowid in rows
+                    ],
+                    many=True,
+                )
 
     @classmethod
     def count_rows(cls, connection):
@@ -249,6 +421,12 @@ class Task(Model):
         "function_name": "TEXT",
         "function_arguments": "BLOB",
     }
+    indexes = (
+        # for selecting the tasks on due:
+        ("task_status_schedule", "status, schedule"),
+        # for looking up crontasks by function:
+        ("task_function", "function_module, function_name"),
+    )
 
     def __init__(
         self,
@@ -282,32 +460,51 @@ class Task(Model):
             f"{self.args} {self.kwargs}"
         )
 
-    def store(self):
-        """
-        Store a new task in the database. Returns the rowid of the new dataset.
-        """
+    def prepare_storage(self):
+        """Set the column data derived from the other attributes."""
         if self.schedule is None:
             self.schedule = datetime.datetime.now()
         if self.func:
             self.function_module = self.func.__module__
             self.function_name = self.func.__name__
-        self.function_arguments = pickle.dumps((self.args, self.kwargs))
+        self.function_arguments = dumps_arguments(self.args, self.kwargs)
+
+    def store(self):
+        """
+        Store a new task in the database. Returns the rowid of the new dataset.
+        """
+        self.prepare_storage()
         super().store()
 
+    @classmethod
+    def store_many(cls, connection, instances):
+        """Store the given tasks with a single executemany() command."""
+        for instance in instances:
+            instance.prepare_storage()
+        super().store_many(connection, instances)
+
     def update(self):
         """Make the current state of attributes persistent."""
         # function arguments may have changed:
-        self.function_arguments = pickle.dumps((self.args, self.kwargs))
+        self.function_arguments = dumps_arguments(self.args, self.kwargs)
         super().update()
 
-    @classmethod
-    def _get_next_task_sql_and_data(cls):
-        """Helper method for next_task and next_cron_task."""
-        sql = cls._get_sql_select()
-        sql = f"""{sql} WHERE schedule <= :schedule
-                  AND status == {TASK_STATUS_WAITING}"""
-        data = {"schedule": datetime.datetime.now()}
-        return sql, data
+    def update_schedule(self, schedule, status=TASK_STATUS_WAITING):
+        """
+        Set the schedule and the status and make just these attributes
+        persistent.
+        """
+        self.schedule = schedule
+        self.status = status
+        sql = f"""UPDATE {self.table_name}
+                  SET schedule = :schedule, status = :status
+                  WHERE rowid == :rowid"""
+        data = {
+            "schedule": datetime_adapter(schedule),
+            "status": status,
+            "rowid": self.rowid,
+        }
+        self.connection.run(sql, data)
 
     @classmethod
     def get_by_function_name(cls, function, connection):
@@ -325,16 +522,25 @@ class Task(Model):
         return cls.select(connection=connection, sql=sql, data=data)
 
     @classmethod
-    def next_task(cls, connection):
-        """Returns a task instance which is on due."""
-        sql, data = cls._get_next_task_sql_and_data()
-        return cls.select(connection, sql=sql, data=data)
-
-    @classmethod
-    def next_cron_task(cls, connection):
-        """Returns a crontask instance which is on due."""
-        sql, data = cls._get_next_task_sql_and_data()
-        sql = f"{sql} AND crontab <> ''"
+    def claim_next_task(cls, connection):
+        """
+        Returns a task instance which is on due with crontasks first or
+        None if there is no task on due. The status of the returned task
+        is set to TASK_STATUS_PROCESSING by the same sql command, so the
+        task can not get claimed twice.
+        """
+        columns = ",".join([*cls.columns, "rowid"])
+        sql = f"""UPDATE {cls.table_name}
+                  SET status = {TASK_STATUS_PROCESSING}
+                  WHERE rowid == (
+                      SELECT rowid FROM {cls.table_name}
+                      WHERE schedule <= :schedule
+                      AND status == {TASK_STATUS_WAITING}
+                      ORDER BY crontab == '', rowid
+                      LIMIT 1
+                  )
+                  RETURNING {columns}"""
+        data = {"schedule": datetime_adapter(datetime.datetime.now())}
         return cls.select(connection, sql=sql, data=data)
 
     @classmethod
@@ -351,22 +557,16 @@ class Task(Model):
         data = {"prev_status": prev_status, "new_status": new_status}
         connection.run(sql, data)
 
-    @staticmethod
-    def row_factory(cursor, row):
+    @classmethod
+    def row_to_data(cls, column_names, row):
         """
-        SQLite factory class to convert a row from a task-table to a
-        dictionary.
+        Converts a row from the task-table to a dictionary.
         """
-        function_arguments_column_name = "function_arguments"
-        data = {}
-        column_names = [entry[0] for entry in cursor.description]
-        for name, value in zip(column_names, row):
-            if name == function_arguments_column_name:
-                args, kwargs = pickle.loads(value)
-                data["args"] = args
-                data["kwargs"] = kwargs
-            else:
-                data[name] = value
+        data = super().row_to_data(column_names, row)
+        if "function_arguments" in data:
+            args, kwargs = pickle.loads(data.pop("function_arguments"))
+            data["args"] = args
+            data["kwargs"] = kwargs
         return data
 
 
@@ -384,6 +584,10 @@ class Result(Model):
         "error_message": "TEXT",
         "ttl": "datetime",
     }
+    indexes = (
+        # for deleting outdated results:
+        ("result_ttl_status", "ttl, status"),
+    )
 
     def __init__(
         self,
@@ -467,18 +671,29 @@ class Result(Model):
             return self.status in processed_states
         return True
 
-    def store(self):
-        """Stores the result as a new entry in the result-table."""
+    def prepare_storage(self):
+        """Set the column data derived from the other attributes."""
         if self.func:
             self.function_module = self.func.__module__
             self.function_name = self.func.__name__
         else:
             self.function_module = ""
             self.function_name = ""
-        self.function_arguments = pickle.dumps((self.args, self.kwargs))
-        self.function_result = pickle.dumps(self.function_result)
+        self.function_arguments = dumps_arguments(self.args, self.kwargs)
+        self.function_result = dumps(self.function_result)
+
+    def store(self):
+        """Stores the result as a new entry in the result-table."""
+        self.prepare_storage()
         super().store()
 
+    @classmethod
+    def store_many(cls, connection, instances):
+        """Store the given results with a single executemany() command."""
+        for instance in instances:
+            instance.prepare_storage()
+        super().store_many(connection, instances)
+
     @classmethod
     def from_registration(
         cls,
@@ -514,6 +729,20 @@ class Result(Model):
         data = {"uuid": uuid}
         return cls.select(connection, sql=sql, data=data)
 
+    @classmethod
+    def has_outdated(cls, connection, schedule):
+        """
+        Returns True if there are result entries with a ttl <= schedule.
+        This is just a read and needs no write-lock.
+        """
+        sql = f"""SELECT EXISTS(
+                    SELECT 1 FROM {cls.table_name}
+                    WHERE status <> {TASK_STATUS_WAITING}
+                    AND ttl <= :ttl
+                  )"""
+        cursor = connection.run(sql, {"ttl": datetime_adapter(schedule)})
+        return bool(cursor.fetchone()[0])
+
     @classmethod
     def delete_outdated(cls, connection, schedule):
         """
@@ -523,21 +752,17 @@ class Result(Model):
         sql = f"""DELETE FROM {cls.table_name}
                   WHERE status <> {TASK_STATUS_WAITING}
                   AND ttl <= :ttl"""
-        connection.run(sql, {"ttl": schedule})
+        connection.run(sql, {"ttl": datetime_adapter(schedule)})
 
-    @staticmethod
-    def row_factory(cursor, row):
+    @classmethod
+    def row_to_data(cls, column_names, row):
         """
-        SQLite factory class to convert a row from the result-table to a
-        dictionary.
+        Converts a row from the result-table to a dictionary.
         """
-        data = {}
-        column_names = [entry[0] for entry in cursor.description]
-        for name, value in zip(column_names, row):
-            if name in ("function_arguments", "function_result"):
-                data[name] = pickle.loads(value)
-            else:
-                data[name] = value
+        data = super().row_to_data(column_names, row)
+        for name in ("function_arguments", "function_result"):
+            if name in data:
+                data[name] = pickle.loads(data[name])
         return data
 
 
@@ -574,11 +799,9 @@ class Settings(Model):
     def __repr__(self):
         """Self representation used by the admin-tool."""
         width = len(max(self.columns, key=len))
-        attributes = []
-        for key in self.columns:
-            value = self.__dict__[key]
-            attributes.append(f"{key:<{width}}: {value}")
-        return "\n".join(attributes)
+        return "\n".join(
+            f"{key:<{width}}: {self.__dict__[key]}" for key in self.columns
+        )
 
     @classmethod
     def read(cls, connection):
@@ -591,17 +814,80 @@ class Settings(Model):
             return None
         return entries[0]
 
-    @staticmethod
-    def row_factory(cursor, row):
+    @classmethod
+    def change(cls, connection, **values):
         """
-        SQLite factory function to convert a row from a settings-table
-        to a dictionary.
+        Set the settings given as keyword arguments in a single sql
+        command without reading the settings first.
         """
-        column_names = [entry[0] for entry in cursor.description]
-        data = {
-            name: bool(value) if name in BOOLEAN_SETTINGS else value
-            for name, value in zip(column_names, row)
-        }
+        if unknown := values.keys() - cls.columns.keys():
+            raise ValueError(f"unknown settings: {', '.join(unknown)}")
+        columns = ",".join(f"{name} = :{name}" for name in values)
+        connection.run(f"UPDATE {cls.table_name} SET {columns}", values)
+
+    @classmethod
+    def acquire_monitor_lock(cls, connection):
+        """
+        Set the monitor_lock if it is not set. Returns True if the lock
+        has been set by this call, otherwise False.
+        """
+        sql = f"""UPDATE {cls.table_name} SET monitor_lock = 1
+                  WHERE monitor_lock == 0"""
+        return connection.run(sql).rowcount > 0
+
+    @classmethod
+    def reset_workers(cls, connection):
+        """Reset the monitor_lock and the worker bookkeeping."""
+        sql = f"""UPDATE {cls.table_name}
+                  SET monitor_lock = 0, running_workers = 0, worker_pids = ''"""
+        connection.run(sql)
+
+    @classmethod
+    def add_worker_pid(cls, connection, pid):
+        """
+        Append the pid to the worker_pids and increment the
+        running_workers in a single sql command.
+        """
+        sql = f"""UPDATE {cls.table_name}
+                  SET worker_pids = ltrim(worker_pids || ',' || :pid, ','),
+                      running_workers = running_workers + 1"""
+        connection.run(sql, {"pid": str(pid)})
+
+    @classmethod
+    def remove_worker_pid(cls, connection, pid):
+        """
+        Remove the pid from the worker_pids and decrement the
+        running_workers in a single sql command. Unknown pids are
+        ignored.
+        """
+        # enclosing the comma separated pids in commas allows to find
+        # and replace every pid by the same pattern:
+        sql = f"""UPDATE {cls.table_name}
+                  SET worker_pids = trim(
+                        replace(',' || worker_pids || ',', :pattern, ','),
+                        ','
+                      ),
+                      running_workers = max(running_workers - 1, 0)
+                  WHERE instr(',' || worker_pids || ',', :pattern)"""
+        connection.run(sql, {"pattern": f",{pid},"})
+
+    @classmethod
+    def has_worker_pid(cls, connection, pid):
+        """Return True if the pid is one of the worker_pids."""
+        sql = f"""SELECT COUNT(*) FROM {cls.table_name}
+                  WHERE instr(',' || worker_pids || ',', :pattern)"""
+        cursor = connection.run(sql, {"pattern": f",{pid},"})
+        return bool(cursor.fetchone()[0])
+
+    @classmethod
+    def row_to_data(cls, column_names, row):
+        """
+        Converts a row from the settings-table to a dictionary.
+        """
+        data = super().row_to_data(column_names, row)
+        for name in BOOLEAN_SETTINGS:
+            if name in data:
+                data[name] = bool(data[name])
         return data
 
 
@@ -644,7 +930,8 @@ class TaskRegistrator:
     def _process_queue(self):
         """
         Register task in a separate thread taking the tasks from a
-        task_queue.
+        task_queue. Tasks already waiting in the queue get registered
+        together by `_register()`.
         """
         while True:
             try:
@@ -657,7 +944,34 @@ class TaskRegistrator:
                 if self.exit_event.is_set():
                     break
             else:
-                self.interface.register_task(**data)
+                registrations = [data]
+                while len(registrations) < REGISTER_BACKGROUND_TASK_BATCH_SIZE:
+                    try:
+                        registrations.append(self.task_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._register(registrations)
+
+    def _register(self, registrations):
+        """
+        Register the given tasks in a single transaction. If this fails,
+        e.g. because of unpicklable arguments, the tasks get registered
+        one by one, so that a single failing task does not lose the
+        others. Failing tasks get logged.
+        """
+        try:
+            self.interface.register_tasks(registrations)
+        except Exception:
+            if len(registrations) > 1:
+                for registration in registrations:
+                    self._register([registration])
+            else:
+                func = registrations[0]["func"]
+                logger.exception(
+                    "autocron: registration of task %s.%s failed",
+                    func.__module__,
+                    func.__name__,
+                )
 
     def start(self):
         """
@@ -682,34 +996,53 @@ class TaskRegistrator:
 class SQLiteConnection:
     """
     SQLite connection. `run()` can get called as often as required. The
-    database keeps connected. Leaving the context will commit and close
-    the database connection. In case of an exception during the context
-    instead of a commit the connection will do a rollback.
+    database keeps connected. Leaving the context will commit. In case
+    of an exception during the context instead of a commit the
+    connection will do a rollback.
+    If an open sqlite3 connection is given, this connection is used and
+    will not get closed on leaving the context. Otherwise a new
+    connection gets opened on entering and closed on leaving the
+    context.
+    If `write_lock` is True, the context gets the write lock on entering,
+    so reads and writes in the context are atomic against other writers.
     """
 
-    def __init__(self, db_name, row_factory=None, exclusive=False):
+    def __init__(
+        self, db_name, row_factory=None, write_lock=False, connection=None
+    ):
         self.row_factory = row_factory
         self.db_name = db_name
-        self.connection = None
-        self.exclusive = exclusive
+        self.connection = connection
+        self.write_lock = write_lock
+        self.keep_open = connection is not None
 
     def __enter__(self):
-        self.connection = sqlite3.connect(
-            database=self.db_name, detect_types=sqlite3.PARSE_DECLTYPES
-        )
+        if not self.keep_open:
+            self.connection = connect(self.db_name)
         if self.row_factory:
             self.connection.row_factory = self.row_factory
-        if self.exclusive:
-            self.connection.execute(SQLITE_EXCLUSIVE_ACCESS)
+        if self.write_lock:
+            self.connection.execute(SQLITE_IMMEDIATE_ACCESS)
         return self
 
     def __exit__(self, *args):
-        if any(args):
-            # there was an exception:
-            self.connection.rollback()
-        else:
-            self.connection.commit()
-        self.connection.close()
+        try:
+            if any(args):
+                # there was an exception:
+                self.connection.rollback()
+            else:
+                self.connection.commit()
+        except sqlite3.Error:
+            # a kept open connection must not stay in the transaction,
+            # otherwise every following BEGIN fails:
+            try:
+                self.connection.rollback()
+            except sqlite3.Error:
+                self.connection.close()
+            raise
+        finally:
+            if not self.keep_open:
+                self.connection.close()
 
     def run(self, command, parameters=(), many=None):
         """
@@ -769,6 +1102,11 @@ class SQLiteInterface:
         self.blocking_mode = None
         self.orig_signal_handlers = {}
         self.set_signal_handlers()
+        # every thread keeps its own connections open for reuse. All
+        # connections are registered to close them on deleting the
+        # database:
+        self._connections = {}
+        self._connections_lock = threading.Lock()
         # the registrator for non blocking registration:
         self.registrator = TaskRegistrator(self)
         self.init_database(f"{TEMPORARY_PREFIX}{str(uuid.uuid4())}.db")
@@ -786,6 +1124,8 @@ class SQLiteInterface:
         absolute path will get used (and must exist). If db_name is None
         set None directly.
         """
+        # connections are bound to the database file:
+        self._close_connection()
         if db_name is None:
             self._db_name = None
         else:
@@ -823,6 +1163,52 @@ class SQLiteInterface:
                 return True
         return False
 
+    def _connect(self, write_lock=False):
+        """
+        Returns a Connection-context for the current database. The
+        underlying sqlite3 connection is kept open and gets reused by
+        the calling thread to save the costs of connecting on every
+        access.
+        """
+        # a connection must not be shared with a forked process:
+        key = (os.getpid(), threading.get_ident(), self.db_name)
+        with self._connections_lock:
+            connection = self._connections.get(key)
+            if connection is None or not is_open(connection):
+                connection = connect(self.db_name)
+                self._connections[key] = connection
+        return Connection(
+            self.db_name, write_lock=write_lock, connection=connection
+        )
+
+    def _close_connection(self):
+        """
+        Closes the connection of the calling thread to the current
+        database if there is one.
+        """
+        key = (os.getpid(), threading.get_ident(), self.db_name)
+        with self._connections_lock:
+            connection = self._connections.pop(key, None)
+        if connection is not None:
+            connection.close()
+
+    def _close_all_connections(self):
+        """
+        Closes the connections of all threads of the current process to
+        the current database. A thread using the database again gets a
+        new connection.
+        """
+        pid = os.getpid()
+        with self._connections_lock:
+            keys = [
+                key
+                for key in self._connections
+                if key[0] == pid and key[2] == self.db_name
+            ]
+            connections = [self._connections.pop(key) for key in keys]
+        for connection in connections:
+            connection.close()
+
     @db_access
     def init_database(self, db_name):
         """
@@ -834,10 +1220,15 @@ class SQLiteInterface:
         else:
             tasks = []
         self.db_name = db_name
-        with Connection(self.db_name, exclusive=True) as conn:
+        with self._connect(write_lock=True) as conn:
             Task.create_table(conn)
             Result.create_table(conn)
             Settings.create_table(conn)
+            cursor = conn.run("PRAGMA user_version")
+            if cursor.fetchone()[0] < SQLITE_SCHEMA_VERSION:
+                Task.migrate_datetime_columns(conn)
+                Result.migrate_datetime_columns(conn)
+                conn.run(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
 
             # try to read the settings. If this fails create the first
             # (and only) settings dataset with the default values:
@@ -856,12 +1247,8 @@ class SQLiteInterface:
             self.blocking_mode = settings.blocking_mode
 
             # copy the tasks if any:
-            for task in tasks:
-                # set connection from the closed one to the new one:
-                task.connection = conn
-                task.store()
+            Task.store_many(conn, tasks)
 
-    @db_access
     def register_task(
         self, func, schedule=None, crontab="", uuid="", args=(), kwargs=None
     ):
@@ -872,38 +1259,65 @@ class SQLiteInterface:
         crontask, check whether the task is already registered and don't
         register the callable again.
         """
-        if self.accept_registrations:
-            if not schedule:
-                schedule = datetime.datetime.now()
-            if kwargs is None:
-                kwargs = {}
-            with Connection(self.db_name, exclusive=True) as conn:
-                if crontab and Task.get_by_function_name(func, conn):
-                    # don't register a crontab twice:
-                    return
-                task = Task(
-                    connection=conn,
-                    func=func,
-                    schedule=schedule,
-                    crontab=crontab,
-                    uuid=uuid,
-                    args=args,
-                    kwargs=kwargs,
-                )
-                task.store()
+        self.register_tasks(
+            [
+                {
+                    "func": func,
+                    "schedule": schedule,
+                    "crontab": crontab,
+                    "uuid": uuid,
+                    "args": args,
+                    "kwargs": kwargs,
+                }
+            ]
+        )
+
+    @db_access
+    def register_tasks(self, registrations):
+        """
+        Store several callables in a single transaction. `registrations`
+        is a sequence of dictionaries with the keyword arguments of
+        `register_task()`. Callers registering many tasks at once should
+        use this method instead of calling `register_task()` for every
+        task.
+        """
+        if not self.accept_registrations:
+            return
+        tasks = []
+        results = []
+        crontab_functions = set()
+        # the same ttl for all results of a single registration:
+        ttl = self.result_ttl
+        with self._connect(write_lock=True) as conn:
+            for registration in registrations:
+                task = Task(**registration)
+                if not task.schedule:
+                    task.schedule = datetime.datetime.now()
+                if task.kwargs is None:
+                    task.kwargs = {}
+                if task.crontab:
+                    function = (task.func.__module__, task.func.__name__)
+                    if function in crontab_functions or (
+                        Task.get_by_function_name(task.func, conn)
+                    ):
+                        # don't register a crontab twice:
+                        continue
+                    crontab_functions.add(function)
+                tasks.append(task)
 
                 # if a uuid is given it is a delayed function that
                 # may return a result:
-                if uuid:
+                if task.uuid:
                     result = Result(
-                        connection=conn,
-                        func=func,
-                        args=args,
-                        kwargs=kwargs,
-                        uuid=uuid,
-                        ttl=self.result_ttl,
+                        func=task.func,
+                        args=task.args,
+                        kwargs=task.kwargs,
+                        uuid=task.uuid,
+                        ttl=ttl,
                     )
-                    result.store()
+                    results.append(result)
+            Task.store_many(conn, tasks)
+            Result.store_many(conn, results)
 
     @db_access
     def get_next_task(self):
@@ -912,46 +1326,40 @@ class SQLiteInterface:
         there is not task on due. If a task is returned the status is
         set to TASK_STATUS_PROCESSING first.
         """
-        with Connection(self.db_name, exclusive=True) as conn:
-            task = Task.next_cron_task(conn) or Task.next_task(conn)
-            if task:
-                task.status = TASK_STATUS_PROCESSING
-                task.update()
-        return task
+        with self._connect() as conn:
+            return Task.claim_next_task(conn)
 
     @db_access
     def update_task_schedule(self, task, schedule):
         """Updates the schedule of the given task."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             task.connection = conn
-            task.schedule = schedule
-            task.status = TASK_STATUS_WAITING
-            task.update()
+            task.update_schedule(schedule)
 
     @db_access
     def count_tasks(self):
         """Return the number of entries in the task-table."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Task.count_rows(conn)
 
     @db_access
     def get_tasks(self):
         """Return a list of all tasks."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Task.select_all(conn)
 
     @db_access
     def delete_task(self, task):
         """Delete the task which may not have a valid connection-attribute."""
         # solution: inject a valid connection
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             task.connection = conn
             task.delete()
 
     @db_access
     def get_results(self):
         """Return a list of all results."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Result.select_all(conn)
 
     @db_access
@@ -959,13 +1367,13 @@ class SQLiteInterface:
         """
         Return a Result instance from the database identified by the uuid.
         """
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Result.from_uuid(connection=conn, uuid=uuid)
 
     @db_access
     def count_results(self):
         """Return the number of entries in the task-table."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Result.count_rows(conn)
 
     @db_access
@@ -974,13 +1382,15 @@ class SQLiteInterface:
         Updates the result with the uuid with the values of the
         arguments result and error_message.
         """
-        function_result = pickle.dumps(result)
+        function_result = dumps(result)
         ttl = ttl if ttl else self.result_ttl
         status = TASK_STATUS_ERROR if error_message else TASK_STATUS_READY
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             result = Result.from_uuid(conn, uuid=uuid)
             result.function_result = function_result
-            result.function_arguments = pickle.dumps(result.function_arguments)
+            result.function_arguments = dumps_arguments(
+                *result.function_arguments
+            )
             result.error_message = error_message
             result.status = status
             result.ttl = ttl
@@ -989,8 +1399,11 @@ class SQLiteInterface:
     @db_access
     def delete_outdated_results(self):
         """Delete all resuts with a ttl <= now."""
-        with Connection(self.db_name) as conn:
-            Result.delete_outdated(conn, datetime.datetime.now())
+        now = datetime.datetime.now()
+        with self._connect() as conn:
+            # a delete takes the write-lock even if nothing gets deleted:
+            if Result.has_outdated(conn, now):
+                Result.delete_outdated(conn, now)
 
     @db_access
     def increment_running_workers(self, pid):
@@ -998,11 +1411,8 @@ class SQLiteInterface:
         Add the pid to the worker pid-list and increase the running
         worker num by 1.
         """
-        with Connection(self.db_name) as conn:
-            settings = Settings.read(connection=conn)
-            settings.worker_pids = f"{settings.worker_pids},{pid}".lstrip(",")
-            settings.running_workers += 1
-            settings.update()
+        with self._connect() as conn:
+            Settings.add_worker_pid(conn, pid)
 
     @db_access
     def decrement_running_workers(self, pid):
@@ -1010,26 +1420,14 @@ class SQLiteInterface:
         Delete the pid from the worker_pids list and decrement the
         running_workers counter.
         """
-        with Connection(self.db_name) as conn:
-            settings = Settings.read(connection=conn)
-            pids = settings.worker_pids.split(",")
-            try:
-                pids.remove(str(pid))
-            except ValueError:
-                # pid not in list: ignore
-                pass
-            else:
-                settings.worker_pids = ",".join(pids)
-                settings.running_workers = len(pids)
-                settings.update()
+        with self._connect() as conn:
+            Settings.remove_worker_pid(conn, pid)
 
     @db_access
     def is_worker_pid(self, pid):
         """Check whether the provided pid is one of the worker pids."""
-        with Connection(self.db_name) as conn:
-            settings = Settings.read(connection=conn)
-        pids = (int(p) for p in settings.worker_pids.split(",") if p)
-        return pid in pids
+        with self._connect() as conn:
+            return Settings.has_worker_pid(conn, pid)
 
     @db_access
     def acquire_monitor_lock(self):
@@ -1039,27 +1437,32 @@ class SQLiteInterface:
         Return True if the flag has been set to True, otherwise return
         False.
         """
-        with Connection(self.db_name, exclusive=True) as conn:
-            settings = Settings.read(connection=conn)
-            if not settings.monitor_lock:
-                settings.monitor_lock = True
-                settings.update()
-                return True
-            return False
+        with self._connect() as conn:
+            return Settings.acquire_monitor_lock(conn)
 
     @db_access
     def get_settings(self):
         """Returns the settings dataset."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             return Settings.read(connection=conn)
 
     @db_access
     def update_settings(self, settings):
         """Updates the settings dataset."""
-        with Connection(self.db_name) as conn:
+        with self._connect() as conn:
             settings.connection = conn
             settings.update()
 
+    @db_access
+    def change_settings(self, **values):
+        """
+        Updates the settings given as keyword arguments, i.e.
+        `change_settings(max_workers=2)`. The other settings are not
+        touched, so no read before the update is required.
+        """
+        with self._connect() as conn:
+            Settings.change(conn, **values)
+
     @db_access
     def tear_down_database(self):
         """
@@ -1067,12 +1470,9 @@ class SQLiteInterface:
         the database again on shutdown. Gets called from the engine on
         shut-down.
         """
-        with Connection(self.db_name, exclusive=True) as conn:
-            settings = Settings.read(conn)
-            settings.monitor_lock = False
-            settings.running_workers = 0
-            settings.worker_pids = ""
-            settings.update()
+        # just writes, so the first one takes the write lock:
+        with self._connect() as conn:
+            Settings.reset_workers(conn)
             Task.delete_crontasks(conn)
             # reset the status of unfinished tasks from the
             # last run to handle them again:
@@ -1082,14 +1482,25 @@ class SQLiteInterface:
                 new_status=TASK_STATUS_WAITING,
             )
 
+    def delete_database(self):
+        """
+        Delete the current database together with the WAL files. The
+        connections of all threads to the database get closed before.
+        """
+        self._delete_database()
+
     @db_access
     def _delete_database(self):
         """
-        Internal command to delete the temporary databases needed for start-up.
+        Internal command to delete the current database together with
+        the WAL files, like the temporary databases needed for start-up.
         """
         if self.db_name is not None:
+            self._close_all_connections()
             db_path = pathlib.Path(self.db_name)
             db_path.unlink(missing_ok=True)
+            for suffix in SQLITE_WAL_FILE_SUFFIXES:
+                db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
 
     def __del__(self):
         # last resort additional to the signal handler
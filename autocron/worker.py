@@ -17,7 +17,7 @@ import signal
 import sys
 import time
 
-from autocron.schedule import CronScheduler
+from autocron.schedule import get_cron_scheduler
 from autocron import sqlite_interface
 
 # check for django, because this will need a modified setup and shutdown
@@ -187,7 +187,7 @@ class Worker:
         if task.crontab:
             # if the task has a crontab calculate new schedule
             # and update the task-entry
-            scheduler = CronScheduler(crontab=task.crontab)
+            scheduler = get_cron_scheduler(task.crontab)
             schedule = scheduler.get_next_schedule()
             self.interface.update_task_schedule(task, schedule)
         else:
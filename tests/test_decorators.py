@@ -42,6 +42,7 @@ def interface():
     decorators.interface = interface
     yield interface
     decorators.interface = decorators_interface
+    interface._delete_database()
     for db_name in (interface.db_name, tmp_db_name):
         if db_name is not None:
             pathlib.Path(interface.db_name).unlink(missing_ok=True)
@@ -40,6 +40,7 @@ def interface():
     interface = sqlite_interface.SQLiteInterface()
     tmp_db_name = interface.db_name
     yield interface
+    interface._delete_database()
     for db_name in (interface.db_name, tmp_db_name):
         if db_name is not None:
             pathlib.Path(interface.db_name).unlink(missing_ok=True)
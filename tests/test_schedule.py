@@ -5,9 +5,16 @@ import pytest
 
 from autocron.schedule import (
     get_cron_parts,
+    get_cron_scheduler,
+    get_days_per_month,
+    get_first_weekday,
+    get_mask,
     get_next_value,
+    get_next_value_from_mask,
+    get_values_from_mask,
     get_numeric_sequence,
     get_weekday,
+    value_in_mask,
     CronScheduler,
 )
 
@@ -30,6 +37,17 @@ def test_get_next_value(value, values, expected_result):
     """
     result = get_next_value(value, values)
     assert result == expected_result
+    # the bitmask-version must return the same values:
+    result = get_next_value_from_mask(value, get_mask(values))
+    assert result == expected_result
+
+
+def test_value_in_mask():
+    values = [0, 5, 10, 59]
+    mask = get_mask(values)
+    for value in range(60):
+        assert value_in_mask(value, mask) is (value in values)
+    assert get_values_from_mask(mask) == tuple(values)
 
 
 @pytest.mark.parametrize(
@@ -53,7 +71,18 @@ def test_get_numeric_sequence(pattern, min_value, max_value, expected_result):
     numeric values.
     """
     result = get_numeric_sequence(pattern, min_value, max_value)
-    assert result == expected_result
+    assert result == tuple(expected_result)
+
+
+@pytest.mark.parametrize(
+    'pattern', ["1-x", "a,2", "3-5/2"]
+)
+def test_get_numeric_sequence_invalid(pattern):
+    """
+    Elements that are not numbers or ranges raise a ValueError.
+    """
+    with pytest.raises(ValueError):
+        get_numeric_sequence(pattern, 0, 59)
 
 
 def test_get_cron_parts():
@@ -62,11 +91,11 @@ def test_get_cron_parts():
     """
     crontab = "2,3-5 * 2-4 */4 */2"
     cp = get_cron_parts(crontab)
-    assert cp.minutes == [2, 3, 4, 5]
-    assert cp.hours == list(range(24))
-    assert cp.days == [2, 3, 4]
-    assert cp.months == [1, 5, 9]
-    assert cp.days_of_week == [0, 2, 4, 6]
+    assert cp.minutes == (2, 3, 4, 5)
+    assert cp.hours == tuple(range(24))
+    assert cp.days == (2, 3, 4)
+    assert cp.months == (1, 5, 9)
+    assert cp.days_of_week == (0, 2, 4, 6)
 
 
 def test_cronscheduler_init():
@@ -77,11 +106,11 @@ def test_cronscheduler_init():
     """
     def check_cp():
         cp = cs.cron_parts
-        assert cp.minutes == [2, 3, 4, 5]
-        assert cp.hours == list(range(24))
-        assert cp.days == [2, 3, 4]
-        assert cp.months == [1, 5, 9]
-        assert cp.days_of_week == [0, 2, 4, 6]
+        assert cp.minutes == (2, 3, 4, 5)
+        assert cp.hours == tuple(range(24))
+        assert cp.days == (2, 3, 4)
+        assert cp.months == (1, 5, 9)
+        assert cp.days_of_week == (0, 2, 4, 6)
 
     # test with crontab
     crontab = "2,3-5 * 2-4 */4 */2"
@@ -98,6 +127,21 @@ def test_cronscheduler_init():
     check_cp()
 
 
+@pytest.mark.parametrize(
+    'year, month, expected_result', [
+        (2024, 1, 31),
+        (2024, 2, 29),
+        (2025, 2, 28),
+        (2000, 2, 29),
+        (2100, 2, 28),
+        (2024, 4, 30),
+        (2024, 12, 31),
+    ]
+)
+def test_get_days_per_month(year, month, expected_result):
+    assert get_days_per_month(year, month) == expected_result
+
+
 @pytest.mark.parametrize(
     'schedule, expected_result', [
         (dt(2024, 2, 12), 1),  # this is a monday
@@ -109,6 +153,16 @@ def test_get_weekday(schedule, expected_result):
     assert result == expected_result
 
 
+@pytest.mark.parametrize(
+    'year, month, expected_result', [
+        (2024, 2, 4),  # thursday
+        (2024, 9, 0),  # sunday
+    ]
+)
+def test_get_first_weekday(year, month, expected_result):
+    assert get_first_weekday(year, month) == expected_result
+
+
 @pytest.mark.parametrize(
     'crontab, minute, expected_result', [
         ("10,20 * * * *", 5, 10),
@@ -160,6 +214,7 @@ def test_get_next_month(crontab, month, expected_result):
         ("* * 10 * 1", 2024, 2, False, 5),
         ("* * 10 * 6", 2024, 2, True, 10),
         ("* * 10 * 5", 2024, 2, True, None),
+        ("* * 15 * 1", 2024, 4, False, 1),  # april 1st is a monday
     ]
 )
 def test_get_first_day(crontab, year, month, strict_mode, expected_result):
@@ -194,6 +249,7 @@ def test_get_next_day(crontab, year, month, day, strict_mode, expected_result):
 @pytest.mark.parametrize(
     'crontab, previous_schedule, strict_mode, expected_result', [
         ("* * * * *", dt(2024, 2, 8, 10, 0), False, dt(2024, 2, 8, 10, 1)),
+        ("* * * * *", dt(2024, 12, 31, 23, 59, 30), False, dt(2025, 1, 1)),
         ("*/5 * * * *", dt(2024, 2, 8, 10, 24), False, dt(2024, 2, 8, 10, 25)),
         ("*/5 * * * *", dt(2024, 2, 8, 10, 25), False, dt(2024, 2, 8, 10, 30)),
         ("0,30 * * * *", dt(2024, 2, 8, 10, 25), False, dt(2024, 2, 8, 10, 30)),
@@ -211,6 +267,9 @@ def test_get_next_day(crontab, year, month, day, strict_mode, expected_result):
         ("30 13 29 2 0", dt(2024, 2, 29, 13, 30), True, dt(2032, 2, 29, 13, 30)),
         ("30 13 7 * 3", dt(2024, 2, 7, 13, 30), True, dt(2024, 8, 7, 13, 30)),
         ("30 13 7 2 3", dt(2024, 2, 7, 13, 30), True, dt(2029, 2, 7, 13, 30)),
+        ("0 12 15 * 7", dt(2024, 2, 15, 12, 0), False, dt(2024, 2, 18, 12, 0)),
+        ("0 12 15 * 7", dt(2024, 2, 15, 12, 0), True, dt(2024, 9, 15, 12, 0)),
+        ("0 12 * * 1-7", dt(2024, 2, 17, 12, 0), True, dt(2024, 2, 18, 12, 0)),
     ]
 )
 def test_get_next_schedule(crontab,
@@ -220,3 +279,81 @@ def test_get_next_schedule(crontab,
     cs = CronScheduler(crontab, strict_mode=strict_mode)
     result = cs.get_next_schedule(previous_schedule)
     assert result == expected_result
+
+
+def test_get_next_schedule_is_cached():
+    """
+    Schedulers with the same crontab are equal and share the cached
+    schedules. Seconds of the previous schedule are ignored.
+    """
+    crontab = "*/5 * * * *"
+    cs = CronScheduler(crontab)
+    assert cs == CronScheduler(f"  {crontab} ")
+    assert cs != CronScheduler(crontab, strict_mode=True)
+    first = cs.get_next_schedule(dt(2024, 2, 8, 10, 24, 10))
+    second = CronScheduler(crontab).get_next_schedule(
+        dt(2024, 2, 8, 10, 24, 50)
+    )
+    assert first is second
+    assert first == dt(2024, 2, 8, 10, 25)
+
+
+@pytest.mark.parametrize(
+    'crontab, strict_mode', [
+        ("* * 30 2 *", False),
+        ("* * 31 4,6,9,11 *", False),
+        ("* * 31 4,6,9,11 *", True),
+    ]
+)
+def test_get_next_schedule_never_matches(crontab, strict_mode):
+    """
+    Crontabs which can never match a valid date raise a ValueError.
+    """
+    cs = CronScheduler(crontab, strict_mode=strict_mode)
+    with pytest.raises(ValueError):
+        cs.get_next_schedule(dt(2024, 2, 8, 23, 59))
+
+
+@pytest.mark.parametrize(
+    'crontab', ["0 0 5-3 * *", "0 5-3 * * *", "0 0 * 12-1 *", "0 0 * * 6-2"]
+)
+def test_empty_field_never_matches(crontab):
+    """
+    Crontabs with an empty field raise a ValueError on initialization.
+    """
+    with pytest.raises(ValueError):
+        CronScheduler(crontab)
+
+
+@pytest.mark.parametrize(
+    'crontab, start, expected_result', [
+        ("* * * * *", dt(2024, 2, 8, 23, 58, 30),
+            [dt(2024, 2, 8, 23, 59), dt(2024, 2, 9, 0, 0)]),
+        ("0,30 5,17 * * *", dt(2024, 2, 8, 10, 30),
+            [dt(2024, 2, 8, 17, 0), dt(2024, 2, 8, 17, 30),
+             dt(2024, 2, 9, 5, 0), dt(2024, 2, 9, 5, 30)]),
+    ]
+)
+def test_iter_schedules(crontab, start, expected_result):
+    schedules = CronScheduler(crontab).iter_schedules(start)
+    result = [next(schedules) for _ in expected_result]
+    assert result == expected_result
+
+
+def test_get_cron_scheduler_is_cached():
+    """
+    The same crontab returns the same scheduler instance.
+    """
+    scheduler = get_cron_scheduler("*/5 * * * *")
+    assert scheduler is get_cron_scheduler("*/5 * * * *")
+    assert scheduler is not get_cron_scheduler("*/5 * * * *", True)
+    assert scheduler == CronScheduler(crontab="*/5 * * * *")
+
+
+def test_get_next_schedules():
+    cs = CronScheduler(crontab="0 12 1 * *")
+    schedules = cs.get_next_schedules(3, dt(2024, 2, 1, 12))
+    assert schedules == [
+        dt(2024, 3, 1, 12), dt(2024, 4, 1, 12), dt(2024, 5, 1, 12)
+    ]
+    assert cs.get_next_schedules(0, dt(2024, 2, 8)) == []
@@ -4,6 +4,10 @@ test_sqlite_interface.py
 
 import datetime
 import pathlib
+import pickle
+import sqlite3
+import threading
+import time
 import uuid
 
 import pytest
@@ -14,11 +18,17 @@ from autocron.sqlite_interface import (
     SETTINGS_DEFAULT_WORKERS,
     TASK_STATUS_WAITING,
     TASK_STATUS_PROCESSING,
+    SQLITE_SCHEMA_VERSION,
     TEMPORARY_PREFIX,
     Connection,
     Settings,
     Result,
-    Task
+    Task,
+    datetime_adapter,
+    datetime_converter,
+    dumps,
+    dumps_arguments,
+    is_open,
 )
 
 
@@ -48,6 +58,7 @@ def raw_interface():
     interface = sqlite_interface.SQLiteInterface()
     tmp_db_name = interface.db_name
     yield interface
+    interface._delete_database()
     for db_name in (interface.db_name, tmp_db_name):
         if db_name is not None:
             pathlib.Path(db_name).unlink(missing_ok=True)
@@ -64,6 +75,7 @@ def interface():
     tmp_db_name = interface.db_name
     interface.init_database(db_name=TEST_DB_NAME)
     yield interface
+    interface._delete_database()
     for db_name in (interface.db_name, tmp_db_name):
         if db_name is not None:
             pathlib.Path(db_name).unlink(missing_ok=True)
@@ -101,6 +113,86 @@ def test_init_database(interface):
     assert settings.monitor_lock is False
 
 
+def test_init_database_indexes(interface):
+    """
+    init_database creates the indexes defined by the models.
+    """
+    sql = "SELECT name FROM sqlite_master WHERE type == 'index'"
+    with Connection(interface.db_name) as conn:
+        names = {row[0] for row in conn.run(sql).fetchall()}
+    for model in (Task, Result):
+        assert {name for name, _ in model.indexes} <= names
+
+
+@pytest.mark.parametrize(
+    "value", [
+        datetime.datetime(1970, 1, 1),
+        datetime.datetime(1969, 12, 31, 23, 59, 59, 999999),
+        datetime.datetime(2024, 2, 29, 12, 30, 15, 123456),
+        datetime.datetime(9999, 12, 31, 23, 59, 59, 999999),
+    ]
+)
+def test_datetime_adapter_and_converter(value):
+    stored = datetime_adapter(value)
+    assert isinstance(stored, int)
+    assert datetime_converter(stored) == value
+    # ISO 8601 strings from former versions are converted as well:
+    assert datetime_converter(value.isoformat()) == value
+
+
+@pytest.mark.parametrize(
+    "args, kwargs", [
+        ((), {}),
+        ((), None),
+        ((1, "a"), {}),
+        ((), {"b": 2}),
+    ]
+)
+def test_dumps_arguments(args, kwargs):
+    assert pickle.loads(dumps_arguments(args, kwargs)) == (args, kwargs)
+    assert pickle.loads(dumps(None)) is None
+
+
+def test_migrate_datetime_columns(interface):
+    """
+    Schedules stored as ISO 8601 strings by former versions get
+    converted to integers on initialization.
+    """
+    schedule = datetime.datetime.now() - datetime.timedelta(hours=1)
+    with Connection(interface.db_name) as conn:
+        task = Task(connection=conn, func=tst_function, schedule=schedule)
+        task.store()
+        conn.run(
+            "UPDATE task SET schedule = ? WHERE rowid == ?",
+            (schedule.isoformat(), task.rowid)
+        )
+        # databases of former versions have no schema version:
+        conn.run("PRAGMA user_version = 0")
+    interface.init_database(db_name=TEST_DB_NAME)
+    with Connection(interface.db_name) as conn:
+        cursor = conn.run("SELECT typeof(schedule) FROM task")
+        assert cursor.fetchone()[0] == "integer"
+        cursor = conn.run("PRAGMA user_version")
+        assert cursor.fetchone()[0] == SQLITE_SCHEMA_VERSION
+    task = interface.get_next_task()
+    assert task.schedule == schedule
+
+
+def test_migrate_datetime_columns_once(interface):
+    """
+    Databases with the current schema version are not migrated again.
+    """
+    with Connection(interface.db_name) as conn:
+        task = Task(connection=conn, func=tst_function)
+        task.store()
+        conn.run(
+            "UPDATE task SET schedule = 'not a datetime' WHERE rowid == ?",
+            (task.rowid,)
+        )
+    # the migration would fail on the invalid schedule:
+    interface.init_database(db_name=TEST_DB_NAME)
+
+
 def test_update_settings(interface):
     """
     Test the .update() method on Model.
@@ -120,6 +212,16 @@ def test_update_settings(interface):
         assert settings.max_workers == max_workers
 
 
+def test_change_settings(interface):
+    interface.change_settings(max_workers=3, blocking_mode=True)
+    settings = interface.get_settings()
+    assert settings.max_workers == 3
+    assert settings.blocking_mode is True
+    assert settings.monitor_lock is False
+    with pytest.raises(ValueError):
+        interface.change_settings(no_setting=1)
+
+
 def test_acquire_monitor_lock(interface):
     """Test to set the monitor_lock flag.
     """
@@ -190,6 +292,15 @@ def test_crud_task(interface):
         assert Task.count_rows(conn) == 0
 
 
+def test_store_many_tasks(interface):
+    tasks = [Task(func=tst_add_function, args=(n, 1)) for n in range(3)]
+    with Connection(interface.db_name) as conn:
+        Task.store_many(conn, tasks)
+    tasks = interface.get_tasks()
+    assert [task.args for task in tasks] == [(0, 1), (1, 1), (2, 1)]
+    assert tasks[0].function_name == tst_add_function.__name__
+
+
 def test_delete_task_via_interface(interface):
     """Delete a task via an interface-method.
     """
@@ -245,6 +356,75 @@ def test_register_delayed_task(interface):
         assert Result.count_rows(conn) == 1
 
 
+def test_register_tasks(interface):
+    """
+    Register several tasks at once. Crontasks should not get registered
+    twice, even if they are given twice in the same call.
+    """
+    interface.register_tasks(
+        [
+            {"func": tst_cron_function, "crontab": "*"},
+            {"func": tst_cron_function, "crontab": "*"},
+            {"func": tst_function, "uuid": "uuid-1", "args": (1,)},
+            {"func": tst_function, "uuid": "uuid-2"},
+        ]
+    )
+    with Connection(interface.db_name) as conn:
+        assert Task.count_rows(conn) == 3
+        assert Result.count_rows(conn) == 2
+    result = interface.get_result_by_uuid("uuid-1")
+    assert result.function_arguments == ((1,), {})
+
+
+def test_registrator_registers_queued_tasks(interface, monkeypatch):
+    """
+    The registrator takes all tasks waiting in the queue for a single
+    registration.
+    """
+    batch_sizes = []
+    register_tasks = interface.register_tasks
+
+    def recording_register_tasks(registrations):
+        batch_sizes.append(len(registrations))
+        register_tasks(registrations)
+
+    monkeypatch.setattr(interface, "register_tasks", recording_register_tasks)
+    registrator = interface.registrator
+    for number in range(3):
+        task_uuid = f"uuid-{number}"
+        registrator.task_queue.put({"func": tst_function, "uuid": task_uuid})
+    registrator.task_queue.put({"func": tst_cron_function, "crontab": "*"})
+    registrator.start()
+    deadline = time.monotonic() + 5
+    while interface.count_tasks() < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    registrator.stop()
+    assert interface.count_tasks() == 4
+    assert interface.count_results() == 3
+    assert batch_sizes == [4]
+
+
+def test_registrator_registers_tasks_of_failing_batch(interface, caplog):
+    """
+    If a batch can not get registered, the registrator registers the
+    tasks one by one and logs the failing ones.
+    """
+    registrator = interface.registrator
+    registrator.task_queue.put({"func": tst_function, "uuid": "uuid-1"})
+    # a lambda can not get pickled:
+    unpicklable = {"func": tst_cron_function, "args": (lambda: 1,)}
+    registrator.task_queue.put(unpicklable)
+    registrator.task_queue.put({"func": tst_function, "uuid": "uuid-2"})
+    registrator.start()
+    deadline = time.monotonic() + 5
+    while interface.count_tasks() < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    registrator.stop()
+    assert interface.count_tasks() == 2
+    assert interface.count_results() == 2
+    assert "tst_cron_function failed" in caplog.text
+
+
 def test_get_next_task(interface):
     """
     Test to just return a task on due.
@@ -309,6 +489,34 @@ def test_get_task_by_function_name(interface):
         assert task.function_name == tst_cron_function.__name__
 
 
+def test_update_task_schedule(interface):
+    interface.register_task(tst_cron_function, crontab="*")
+    task = interface.get_next_task()
+    assert task.status == TASK_STATUS_PROCESSING
+    schedule = datetime.datetime(2100, 1, 1)
+    interface.update_task_schedule(task, schedule)
+    task = interface.get_tasks()[0]
+    assert task.schedule == schedule
+    assert task.status == TASK_STATUS_WAITING
+
+
+def test_tear_down_database(interface):
+    interface.acquire_monitor_lock()
+    interface.increment_running_workers(pid=123)
+    interface.register_task(tst_cron_function, crontab="*")
+    interface.register_task(tst_function)
+    interface.get_next_task()  # the crontask
+    interface.get_next_task()  # the delayed task
+    interface.tear_down_database()
+    settings = interface.get_settings()
+    assert settings.monitor_lock is False
+    assert settings.running_workers == 0
+    assert settings.worker_pids == ""
+    tasks = interface.get_tasks()
+    assert len(tasks) == 1
+    assert tasks[0].status == TASK_STATUS_WAITING
+
+
 def test_task_is_ready(interface):
     """
     Test for correct refresh of a Result instance on calling 'is_ready()'.
@@ -454,8 +662,73 @@ def test_delete_database(interface):
     """
     db_path = pathlib.Path(interface.db_name)
     assert db_path.exists() is True
-    interface._delete_database()
+    interface.delete_database()
     assert db_path.exists() is False
+    for suffix in ("-wal", "-shm"):
+        assert db_path.with_name(db_path.name + suffix).exists() is False
+
+
+def test_delete_database_closes_all_connections(interface):
+    """
+    Deleting the database also closes the connections of other threads.
+    """
+    connections = []
+
+    def connect():
+        with interface._connect() as conn:
+            connections.append(conn.connection)
+
+    thread = threading.Thread(target=connect)
+    thread.start()
+    thread.join()
+    interface._delete_database()
+    assert is_open(connections[0]) is False
+
+
+def test_connection_is_reused(interface):
+    """
+    The interface keeps the connection to the database open in WAL mode
+    and reuses it.
+    """
+    with interface._connect() as conn:
+        connection = conn.connection
+        journal_mode = conn.run("PRAGMA journal_mode").fetchone()[0]
+        cache_size = conn.run("PRAGMA cache_size").fetchone()[0]
+    assert journal_mode == "wal"
+    assert cache_size == -64000
+    with interface._connect(write_lock=True) as conn:
+        assert conn.connection is connection
+
+
+def test_connection_recovers_from_failed_commit(interface):
+    """
+    A failed commit must not leave the kept open connection in the
+    transaction, so following writes with a write lock still work.
+    """
+    with interface._connect() as conn:
+        conn.run("PRAGMA foreign_keys = ON")
+        conn.run("CREATE TABLE parent(id INTEGER PRIMARY KEY)")
+        conn.run(
+            """CREATE TABLE child(parent_id INTEGER REFERENCES parent(id)
+               DEFERRABLE INITIALLY DEFERRED)"""
+        )
+    # the deferred foreign key violation lets the commit fail:
+    with pytest.raises(sqlite3.IntegrityError):
+        with interface._connect() as conn:
+            conn.run("INSERT INTO child VALUES (1)")
+    interface.register_task(tst_function)
+    assert interface.count_tasks() == 1
+
+
+def test_closed_connection_gets_replaced(interface):
+    """
+    A closed connection is not reused but replaced by a new one.
+    """
+    with interface._connect() as conn:
+        pass
+    conn.connection.close()
+    interface.register_task(tst_function)
+    assert interface.count_tasks() == 1
 
 
 def test_check_temporary_database_property(raw_interface):
@@ -34,6 +34,7 @@ def interface():
     tmp_db_name = interface.db_name
     interface.init_database(db_name=TEST_DB_NAME)
     yield interface
+    interface._delete_database()
     for db_name in (interface.db_name, tmp_db_name):
         if db_name is not None:
             pathlib.Path(db_name).unlink(missing_ok=True)